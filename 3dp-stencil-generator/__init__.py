@@ -4,9 +4,16 @@
 # Repository: https://github.com/hugelton/3DP-Stencil-Generator
 
 import pcbnew
-import re
 import datetime
+import io
+import math
 import os
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # NumPy is optional - pure Python fallbacks are used without it
 
 
 # === Global configuration ===
@@ -17,6 +24,8 @@ back_copper_pads = False # Generate back copper pads
 min_mask_width = 0.20    # Minimum mask width (mm) between pads
 min_pad_size = 0.40      # Minimum pad size (mm) after shrinking
 pcbClearence = 0.15      # PCB clearance (mm) - moves outline outward from Edge.Cuts
+arcTolerance = 0.02      # Maximum deviation (mm) of the Edge.Cuts arc segments from the true arc
+DEBUG = os.environ.get("KICAD_STENCILGEN_DEBUG", "").strip().lower() in ("1", "true", "yes", "on")  # Write per-shape details and all_layers_debug.log
 
 import wx
 
@@ -79,6 +88,132 @@ class StencilParametersDialog(wx.Dialog):
             return None
 
 
+class LogProxy:
+    """Forward messages to a log function, debug messages are only formatted when enabled"""
+    def __init__(self, log_function, enabled=False):
+        self.log_function = log_function
+        self.enabled = enabled
+
+    def __call__(self, msg):
+        self.log_function(msg)
+
+    def debug(self, fmt, *args):
+        if self.enabled:
+            self.log_function(fmt % args)
+
+
+# pcbnew shape types and layer ids used while scanning drawings, looked up once at import
+SHAPE_SEGMENT = pcbnew.SHAPE_T_SEGMENT
+SHAPE_RECT = pcbnew.SHAPE_T_RECT
+SHAPE_CIRCLE = pcbnew.SHAPE_T_CIRCLE
+SHAPE_ARC = pcbnew.SHAPE_T_ARC
+EDGE_CUTS = pcbnew.Edge_Cuts
+
+
+# Groups smaller than this are handled by the scalar kernel even when NumPy is available,
+# for a handful of pads its loops are quicker than setting up the vectorized pair arrays
+VECTORIZE_MIN_GROUP = 16
+
+# Only groups of at least this many pads use the Numba kernel, importing Numba and loading the
+# compiled kernel costs a few hundred ms per session, which smaller groups never earn back
+JIT_MIN_GROUP = 128
+
+# Up to this many pads, close pads are found with NumPy from a dense pairwise distance matrix,
+# beyond that its N^2 work outgrows the uniform pad grid search the larger boards use instead
+DENSE_PAIRS_MAX_PADS = 200
+
+
+def shrink_kernel(group_indices, xs, ys, half_widths, half_heights, min_mask_width, min_pad_size):
+    """Return the (width, height) shrink factors of a pad group, scalar loop over pad geometry arrays.
+    
+    Kept free of dicts and globals so Numba can compile it when it is installed.
+    """
+    # Find the most constraining pad pairs for each direction
+    min_width_shrink = 1.0
+    min_height_shrink = 1.0
+    n = len(group_indices)
+    
+    # Each unordered pair is checked once (b > a), the gap checks are symmetric in the two pads
+    for a in range(n):
+        i = group_indices[a]
+        for b in range(a + 1, n):
+            j = group_indices[b]
+            dx = xs[j] - xs[i]
+            dy = ys[j] - ys[i]
+            
+            # Skip (nearly) coincident pads, closer than 0.001mm
+            if dx*dx + dy*dy < 0.000001:
+                continue
+            
+            # Check X-direction constraint (pads side-by-side)
+            if abs(dx) > abs(dy) * 1.5:  # Primarily X-direction separation
+                current_gap = abs(dx) - half_widths[i] - half_widths[j]
+                
+                if current_gap < min_mask_width:
+                    required_shrink = (abs(dx) - min_mask_width) / (half_widths[i] + half_widths[j])
+                    min_width_shrink = required_shrink if required_shrink < min_width_shrink else min_width_shrink
+            
+            # Check Y-direction constraint (pads above/below each other)
+            elif abs(dy) > abs(dx) * 1.5:  # Primarily Y-direction separation
+                current_gap = abs(dy) - half_heights[i] - half_heights[j]
+                
+                if current_gap < min_mask_width:
+                    required_shrink = (abs(dy) - min_mask_width) / (half_heights[i] + half_heights[j])
+                    min_height_shrink = required_shrink if required_shrink < min_height_shrink else min_height_shrink
+            
+            # Check diagonal constraints (pads close in both directions)
+            else:
+                # Both X and Y constraints may apply
+                current_gap_x = abs(dx) - half_widths[i] - half_widths[j]
+                current_gap_y = abs(dy) - half_heights[i] - half_heights[j]
+                
+                if current_gap_x < min_mask_width:
+                    required_shrink_x = (abs(dx) - min_mask_width) / (half_widths[i] + half_widths[j])
+                    min_width_shrink = required_shrink_x if required_shrink_x < min_width_shrink else min_width_shrink
+                
+                if current_gap_y < min_mask_width:
+                    required_shrink_y = (abs(dy) - min_mask_width) / (half_heights[i] + half_heights[j])
+                    min_height_shrink = required_shrink_y if required_shrink_y < min_height_shrink else min_height_shrink
+    
+    # Ensure minimum pad size (don't shrink below 0.1mm)
+    for a in range(n):
+        i = group_indices[a]
+        width = 2 * half_widths[i]
+        height = 2 * half_heights[i]
+        if width * min_width_shrink < min_pad_size:
+            required_shrink = min_pad_size / width
+            min_width_shrink = required_shrink if required_shrink > min_width_shrink else min_width_shrink
+        if height * min_height_shrink < min_pad_size:
+            required_shrink = min_pad_size / height
+            min_height_shrink = required_shrink if required_shrink > min_height_shrink else min_height_shrink
+    
+    return min_width_shrink, min_height_shrink
+
+# shrink_kernel compiled by Numba, set up on first use by get_shrink_kernel_jit() (False without Numba)
+shrink_kernel_jit = None
+
+
+def get_shrink_kernel_jit():
+    """Return shrink_kernel compiled with Numba, or None when Numba is not available.
+    
+    Numba is only imported the first time a pad group needs it, so loading the plugin stays cheap.
+    """
+    global shrink_kernel_jit
+    if shrink_kernel_jit is None:
+        try:
+            import numba
+        except Exception:
+            shrink_kernel_jit = False  # Numba is optional - the shrink kernel then runs as plain Python
+            return None
+        try:
+            # cache=True keeps the compiled kernel on disk (next to the plugin, or in the user's cache
+            # directory when the plugin folder is read-only), so it is only compiled on the very first run
+            shrink_kernel_jit = numba.njit(cache=True)(shrink_kernel)
+        except Exception:
+            # No usable cache location, compile for this session only
+            shrink_kernel_jit = numba.njit(shrink_kernel)
+    return shrink_kernel_jit or None
+
 
 class StencilGenerator(pcbnew.ActionPlugin):
     def defaults(self):
@@ -114,6 +249,9 @@ class StencilGenerator(pcbnew.ActionPlugin):
         return False  # User cancelled
 
     def Run(self):
+        # Log lines are collected in memory and written to the log file once at the end
+        self._log_buf = []
+        log_file = None
         try:
             board = pcbnew.GetBoard()
             project_file = board.GetFileName()
@@ -128,8 +266,8 @@ class StencilGenerator(pcbnew.ActionPlugin):
             log_file = os.path.join(output_dir, "kicad_stencilgen_debug.log")
    
             def log(msg):
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(f"{datetime.datetime.now()} - {msg}\n")
+                self._log_buf.append(f"{datetime.datetime.now()} - {msg}\n")
+            self.log_function = log
     
             log(f"===== Plugin started - BUILD {BUILD} =====")
             log(f"Project directory: {project_dir}")
@@ -141,12 +279,14 @@ class StencilGenerator(pcbnew.ActionPlugin):
                 return  # User cancelled, exit
 
     
-            base_filename = re.sub(r'\.[^.]*$', '', os.path.basename(project_file))
+            base_filename = os.path.splitext(os.path.basename(project_file))[0]
             output_filename = os.path.join(output_dir, f"{base_filename}_stencil.scad")
     
-            with open(output_filename, 'w', encoding='utf-8') as f:
-                f.write(self.generate_openscad(board))
-                log(f"SCAD file written: {output_filename}")
+            # Generate into memory first, then write the file in one go
+            buf = io.StringIO()
+            self.generate_openscad(board, buf)
+            self.write_file(output_filename, buf.getvalue().encode('utf-8'))
+            log(f"SCAD file written: {output_filename}")
     
             pcbnew.Refresh()
             print(f"OpenSCAD file generated: {output_filename}")
@@ -169,74 +309,94 @@ class StencilGenerator(pcbnew.ActionPlugin):
     
         except Exception as e:
             msg = f"ERROR in Run(): {repr(e)}"
-            try:
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(f"{datetime.datetime.now()} - {msg}\n")
-            except:
-                print("Error writing to log file.")
+            self._log_buf.append(f"{datetime.datetime.now()} - {msg}\n")
             print(msg)
+    
+        finally:
+            if log_file and self._log_buf:
+                try:
+                    with open(log_file, "a", encoding="utf-8", buffering=1 << 16) as f:
+                        f.writelines(self._log_buf)
+                except:
+                    print("Error writing to log file.")
+            self._log_buf = []
+
+    def write_file(self, filename, data):
+        """Write data to filename straight through the OS file descriptor, without a Python file object"""
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            # os.write may write less than asked for, so keep going until everything is out
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
 
-    def generate_openscad(self, board):
-        scad = "// KiCad Stencil Generator\n"
-        scad += f"// Generated on {datetime.datetime.now()}\n\n"
-
-        scad += "// Parameters (adjust as needed)\n"
-        scad += "stencil_thickness = 0.2;  // mm (Thickness of the stencil)\n"
-        scad += "frame_height = 2.0;       // mm (Height of the frame)\n"
-        scad += "pcb_thickness = 1.6;      // mm (Thickness of the PCB)\n"
-        scad += "alignment_pin_diameter = 3.0;  // mm (Diameter of alignment holes)\n"
-        scad += "\n"
-        scad += "// Feature toggle\n"
-        scad += "enable_alignment_holes = true;\n"
-        scad += "\n"
-        scad += "$fs = 0.1;  // Set minimum facet size for curves\n"
-        scad += "$fa = 5;    // Set minimum angle for facets\n\n"
-
-        scad += self.generate_modules(board)
-
-        scad += "union(){\n"
-        scad += "stencil();\n"
-        scad += "        if (enable_alignment_holes) alignment_holes();\n}"
-
-        return scad
-
-    def generate_modules(self, board):
-        scad = "module frame() {\n"
-        scad += self.generate_frame(board)
-        scad += "}\n\n"
-
-        scad += "module pcb_outline() {\n"
-        scad += self.generate_pcb_outline(board)
-        scad += "}\n\n"
-
-        scad += "module pads() {\n"
-        scad += self.generate_pads(board)
-        scad += "}\n\n"
-
-        scad += "module alignment_holes() {\n"
-        scad += self.generate_alignment_holes(board)
-        scad += "}\n\n"
-
-        scad += "module stencil() {\n"
-        scad += "    difference() {\n"
-        scad += "        frame();\n"
-        scad += "        translate([0, 0, frame_height - pcb_thickness]) {\n"
-        scad += "            linear_extrude(height=pcb_thickness + 0.01) {\n"
-        scad += "                pcb_outline();\n"
-        scad += "            }\n"
-        scad += "        }\n"
-        scad += "        translate([0, 0, - stencil_thickness]) {\n"
-        scad += "            linear_extrude(height=frame_height + stencil_thickness) {\n"
-        scad += "                pads();\n"
-        scad += "            }\n"
-        scad += "        }\n"
-        scad += "    }\n"
-        scad += "}\n\n"
-
-        return scad
+    def generate_openscad(self, board, out):
+        self.reset_caches()
+
+        out.write("// KiCad Stencil Generator\n")
+        out.write(f"// Generated on {datetime.datetime.now()}\n\n")
+
+        out.write("// Parameters (adjust as needed)\n")
+        out.write("stencil_thickness = 0.2;  // mm (Thickness of the stencil)\n")
+        out.write("frame_height = 2.0;       // mm (Height of the frame)\n")
+        out.write("pcb_thickness = 1.6;      // mm (Thickness of the PCB)\n")
+        out.write("alignment_pin_diameter = 3.0;  // mm (Diameter of alignment holes)\n")
+        out.write("\n")
+        out.write("// Feature toggle\n")
+        out.write("enable_alignment_holes = true;\n")
+        out.write("\n")
+        out.write("$fs = 0.1;  // Set minimum facet size for curves\n")
+        out.write("$fa = 5;    // Set minimum angle for facets\n\n")
+
+        self.generate_modules(board, out)
+
+        out.write("union(){\n")
+        out.write("stencil();\n")
+        out.write("        if (enable_alignment_holes) alignment_holes();\n}")
+
+    def generate_modules(self, board, out):
+        out.write("module frame() {\n")
+        self.generate_frame(board, out)
+        out.write("}\n\n")
+
+        out.write("module pcb_outline() {\n")
+        self.generate_pcb_outline(board, out)
+        out.write("}\n\n")
+
+        out.write("module pads() {\n")
+        self.generate_pads(board, out)
+        out.write("}\n\n")
+
+        out.write("module alignment_holes() {\n")
+        self.generate_alignment_holes(board, out)
+        out.write("}\n\n")
+
+        out.write("module stencil() {\n")
+        out.write("    difference() {\n")
+        out.write("        frame();\n")
+        out.write("        translate([0, 0, frame_height - pcb_thickness]) {\n")
+        out.write("            linear_extrude(height=pcb_thickness + 0.01) {\n")
+        out.write("                pcb_outline();\n")
+        out.write("            }\n")
+        out.write("        }\n")
+        out.write("        translate([0, 0, - stencil_thickness]) {\n")
+        out.write("            linear_extrude(height=frame_height + stencil_thickness) {\n")
+        out.write("                pads();\n")
+        out.write("            }\n")
+        out.write("        }\n")
+        out.write("    }\n")
+        out.write("}\n\n")
 
     def calculate_pcb_bounds(self, board):
         """Calculate PCB bounds for frame generation"""
+        if self._pcb_bounds_cache is None:
+            self._pcb_bounds_cache = self.find_pcb_bounds(board)
+        return self._pcb_bounds_cache
+
+    def find_pcb_bounds(self, board):
+        """Find the PCB bounds from User.9, Edge.Cuts or the board bounding box"""
         # Try User.9 first (preferred method)
         pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
         if pcb_rect:
@@ -253,55 +413,18 @@ class StencilGenerator(pcbnew.ActionPlugin):
             }
         
         # Fallback: analyze Edge.Cuts to determine bounds
-        # Get all Edge.Cuts elements to calculate bounding box
-        min_x = float('inf')
-        max_x = float('-inf')
-        min_y = float('inf')
-        max_y = float('-inf')
+        # Collect the extreme points of all Edge.Cuts elements, then reduce them in one go
+        points_x = []
+        points_y = []
         
-        found_edge_cuts = False
+        for edge_cut in self.get_edge_cuts(board):
+            points_x += edge_cut['extreme_x']
+            points_y += edge_cut['extreme_y']
         
-        for drawing in board.GetDrawings():
-            if drawing.GetLayer() == pcbnew.Edge_Cuts and isinstance(drawing, pcbnew.PCB_SHAPE):
-                found_edge_cuts = True
-                shape_type = drawing.GetShape()
-                
-                if shape_type == pcbnew.SHAPE_T_SEGMENT:
-                    start = drawing.GetStart()
-                    end = drawing.GetEnd()
-                    min_x = min(min_x, start.x, end.x)
-                    max_x = max(max_x, start.x, end.x)
-                    min_y = min(min_y, start.y, end.y)
-                    max_y = max(max_y, start.y, end.y)
-                    
-                elif shape_type == pcbnew.SHAPE_T_CIRCLE:
-                    center = drawing.GetCenter()
-                    radius = drawing.GetRadius()
-                    min_x = min(min_x, center.x - radius)
-                    max_x = max(max_x, center.x + radius)
-                    min_y = min(min_y, center.y - radius)
-                    max_y = max(max_y, center.y + radius)
-                    
-                elif shape_type == pcbnew.SHAPE_T_RECT:
-                    start = drawing.GetStart()
-                    end = drawing.GetEnd()
-                    min_x = min(min_x, start.x, end.x)
-                    max_x = max(max_x, start.x, end.x)
-                    min_y = min(min_y, start.y, end.y)
-                    max_y = max(max_y, start.y, end.y)
-                    
-                elif shape_type == pcbnew.SHAPE_T_ARC:
-                    # For arcs, include start, end, and center points as approximation
-                    center = drawing.GetCenter()
-                    start = drawing.GetStart()
-                    end = drawing.GetEnd()
-                    min_x = min(min_x, center.x, start.x, end.x)
-                    max_x = max(max_x, center.x, start.x, end.x)
-                    min_y = min(min_y, center.y, start.y, end.y)
-                    max_y = max(max_y, center.y, start.y, end.y)
-        
-        if found_edge_cuts and min_x != float('inf'):
+        if points_x:
             # Calculate bounds from Edge.Cuts
+            min_x, max_x = min(points_x), max(points_x)
+            min_y, max_y = min(points_y), max(points_y)
             center_x = (min_x + max_x) / 2
             center_y = (min_y + max_y) / 2
             width = self.mm(max_x - min_x)
@@ -315,8 +438,9 @@ class StencilGenerator(pcbnew.ActionPlugin):
         
         # Ultimate fallback: use board bounding box
         bbox = board.GetBoundingBox()
-        center_x = bbox.GetCenter().x
-        center_y = bbox.GetCenter().y
+        bbox_center = bbox.GetCenter()
+        center_x = bbox_center.x
+        center_y = bbox_center.y
         width = self.mm(bbox.GetWidth())
         height = self.mm(bbox.GetHeight())
         
@@ -327,16 +451,115 @@ class StencilGenerator(pcbnew.ActionPlugin):
             'height': height
         }
 
-    def generate_frame(self, board):
+    def get_board_center(self, board):
+        """Center of the User.9 rectangle, or of the board bounding box when there is none"""
+        if self._board_center_cache is None:
+            pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
+            if pcb_rect:
+                self._board_center_cache = (pcb_rect[0] + pcb_rect[2]/2, pcb_rect[1] + pcb_rect[3]/2)
+            else:
+                bbox_center = board.GetBoundingBox().GetCenter()
+                self._board_center_cache = (bbox_center.x, bbox_center.y)
+        return self._board_center_cache
+
+    def index_drawings(self, board):
+        """Bucket all board drawings by layer id, and their PCB shapes by (layer id, shape type).
+        The board drawings are only walked once per generation run."""
+        if self._drawings_index_cache is None:
+            drawings_by_layer = defaultdict(list)
+            shapes_by_layer = defaultdict(list)
+            pcb_shape = pcbnew.PCB_SHAPE
+            for drawing in board.GetDrawings():
+                layer = drawing.GetLayer()
+                drawings_by_layer[layer].append(drawing)
+                if isinstance(drawing, pcb_shape):
+                    shapes_by_layer[(layer, drawing.GetShape())].append(drawing)
+            self._drawings_index_cache = (dict(drawings_by_layer), dict(shapes_by_layer))
+        return self._drawings_index_cache
+
+    def get_drawings_by_layer(self, board):
+        """Get all board drawings bucketed by layer id"""
+        return self.index_drawings(board)[0]
+
+    def get_shapes_on_layer(self, board, layer, shape_type):
+        """Get the PCB shapes of one shape type on a layer"""
+        return self.index_drawings(board)[1].get((layer, shape_type), ())
+
+    def get_edge_cuts(self, board):
+        """Get all Edge.Cuts shapes as dicts with their coordinates in nm.
+        The board is only scanned once per generation run."""
+        if self._edge_cuts_cache is None:
+            # Shape type -> reader that fetches only the properties that shape type needs
+            readers = {
+                SHAPE_SEGMENT: self.read_line_edge_cut,
+                SHAPE_RECT: self.read_line_edge_cut,
+                SHAPE_CIRCLE: self.read_circle_edge_cut,
+                SHAPE_ARC: self.read_arc_edge_cut,
+            }
+            
+            edge_cuts = []
+            pcb_shape = pcbnew.PCB_SHAPE
+            for drawing in self.get_drawings_by_layer(board).get(EDGE_CUTS, ()):
+                if not isinstance(drawing, pcb_shape):
+                    continue
+                    
+                shape_type = drawing.GetShape()
+                reader = readers.get(shape_type)
+                if reader:
+                    edge_cut = reader(drawing)
+                    edge_cut['type'] = shape_type
+                    edge_cuts.append(edge_cut)
+                    
+            self._edge_cuts_cache = edge_cuts
+        return self._edge_cuts_cache
+
+    def read_line_edge_cut(self, drawing):
+        """Read a segment or rectangle, its extreme points are its start and end"""
+        start = drawing.GetStart()
+        end = drawing.GetEnd()
+        return {
+            'sx': start.x, 'sy': start.y, 'ex': end.x, 'ey': end.y,
+            'extreme_x': (start.x, end.x), 'extreme_y': (start.y, end.y)
+        }
+
+    def read_circle_edge_cut(self, drawing):
+        """Read a circle, its extreme points are its center +/- radius"""
+        center = drawing.GetCenter()
+        radius = drawing.GetRadius()
+        return {
+            'cx': center.x, 'cy': center.y, 'r': radius,
+            'extreme_x': (center.x - radius, center.x + radius),
+            'extreme_y': (center.y - radius, center.y + radius)
+        }
+
+    def read_arc_edge_cut(self, drawing):
+        """Read an arc, its start, end and center points approximate its extreme points"""
+        start = drawing.GetStart()
+        end = drawing.GetEnd()
+        center = drawing.GetCenter()
+        return {
+            'sx': start.x, 'sy': start.y, 'ex': end.x, 'ey': end.y, 'cx': center.x, 'cy': center.y,
+            'extreme_x': (center.x, start.x, end.x), 'extreme_y': (center.y, start.y, end.y)
+        }
+
+    def reset_caches(self):
+        """Forget all board data cached during a previous generation run"""
+        self._board_center_cache = None
+        self._drawings_index_cache = None
+        self._edge_cuts_cache = None
+        self._pcb_bounds_cache = None
+        self._shape_cache = {}
+
+    def generate_frame(self, board, out):
         # First, try to find existing rectangle on User.8 layer
         frame_rect = self.find_shape_on_layer(board, pcbnew.User_8)
         
         if frame_rect:
             # User.8 rectangle found - use existing logic
-            scad = f"    linear_extrude(height=frame_height) {{\n"
-            scad += f"        square([{self.mm(frame_rect[2])}, {self.mm(frame_rect[3])}], center=true);\n"
-            scad += "    }\n"
-            return scad
+            out.write(f"    linear_extrude(height=frame_height) {{\n")
+            out.write(f"        square([{self.mm(frame_rect[2])}, {self.mm(frame_rect[3])}], center=true);\n")
+            out.write("    }\n")
+            return
     
         # User.8 rectangle not found - auto-calculate frame
         pcb_bounds = self.calculate_pcb_bounds(board)
@@ -346,51 +569,57 @@ class StencilGenerator(pcbnew.ActionPlugin):
         frame_width = pcb_bounds['width'] + (2 * frame_margin)
         frame_height = pcb_bounds['height'] + (2 * frame_margin)
         
-        scad = f"    // Auto-calculated frame (PCB + {frame_margin}mm margin)\n"
-        scad += f"    linear_extrude(height=frame_height) {{\n"
-        scad += f"        square([{frame_width}, {frame_height}], center=true);\n"
-        scad += "    }\n"
-        
-        return scad
+        out.write(f"    // Auto-calculated frame (PCB + {frame_margin}mm margin)\n")
+        out.write(f"    linear_extrude(height=frame_height) {{\n")
+        out.write(f"        square([{frame_width}, {frame_height}], center=true);\n")
+        out.write("    }\n")
     
     def connect_line_segments(self, segments):
         """Try to connect line segments into a closed polygon"""
         if not segments:
             return []
         
+        tolerance = 0.01  # mm tolerance for connecting points
+        
+        # Index segment endpoints by grid cell, the cells are twice the tolerance wide so two points
+        # within tolerance of each other always end up in the same or in neighbouring cells
+        # (even with rounding in the division)
+        cell_size = 2 * tolerance
+        
+        def cell(point):
+            return (math.floor(point[0] / cell_size), math.floor(point[1] / cell_size))
+        
+        endpoint_map = defaultdict(list)
+        for i, (start, end) in enumerate(segments):
+            endpoint_map[cell(start)].append((i, 0))
+            endpoint_map[cell(end)].append((i, 1))
+        
         # Start with the first segment
         polygon = list(segments[0])
         used_segments = {0}
         
-        tolerance = 0.01  # mm tolerance for connecting points
-        
         while len(used_segments) < len(segments):
             last_point = polygon[-1]
-            found_connection = False
+            cell_x, cell_y = cell(last_point)
             
-            # Look for a segment that connects to the last point
-            for i, segment in enumerate(segments):
-                if i in used_segments:
-                    continue
-                    
-                start, end = segment
-                
-                # Check if segment start connects to last point
-                if self.points_close(last_point, start, tolerance):
-                    polygon.append(end)
-                    used_segments.add(i)
-                    found_connection = True
-                    break
-                # Check if segment end connects to last point
-                elif self.points_close(last_point, end, tolerance):
-                    polygon.append(start)
-                    used_segments.add(i)
-                    found_connection = True
-                    break
+            # Look for the first unused segment (start before end) that connects to the last point
+            connection = None
+            for nx in (cell_x - 1, cell_x, cell_x + 1):
+                for ny in (cell_y - 1, cell_y, cell_y + 1):
+                    for candidate in endpoint_map.get((nx, ny), ()):
+                        if candidate[0] in used_segments or (connection and candidate > connection):
+                            continue
+                        if self.points_close(last_point, segments[candidate[0]][candidate[1]], tolerance):
+                            connection = candidate
             
-            if not found_connection:
+            if not connection:
                 # Can't connect more segments
                 break
+            
+            # Continue the polygon with the other end of the connecting segment
+            i, connected_end = connection
+            polygon.append(segments[i][1 - connected_end])
+            used_segments.add(i)
         
         # Check if we have a closed polygon (last point connects to first)
         if len(polygon) > 2 and self.points_close(polygon[-1], polygon[0], tolerance):
@@ -410,108 +639,108 @@ class StencilGenerator(pcbnew.ActionPlugin):
     def mm(self, nm):
         return nm / 1e6
 
-    def generate_pcb_outline_from_edge_cuts(self, board):
+    def mm_list(self, nm_values, offset=0):
+        """Convert a list of nm values, relative to offset (nm), to a list of mm values in one go"""
+        if np is not None:
+            return ((np.asarray(nm_values, dtype=float) - offset) / 1e6).tolist()
+        return [(nm - offset) / 1e6 for nm in nm_values]
+
+    def get_logger(self):
+        """Return a LogProxy for the log function set up by Run(), or for stdout"""
+        return LogProxy(getattr(self, 'log_function', lambda msg: print(f"DEBUG: {msg}")), DEBUG)
+
+    def generate_pcb_outline_from_edge_cuts(self, board, out):
       """Generate PCB outline from Edge.Cuts layer as a single polygon or union of shapes"""
       
-      log = getattr(self, 'log_function', lambda msg: print(f"DEBUG: {msg}"))
+      log = self.get_logger()
       
       log("=== Starting Edge.Cuts analysis ===")
       
       # Get PCB bounding box for centering
-      pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
-      if pcb_rect:
-          center_x = pcb_rect[0] + pcb_rect[2]/2
-          center_y = pcb_rect[1] + pcb_rect[3]/2
+      center_x, center_y = self.get_board_center(board)
+      if self.find_shape_on_layer(board, pcbnew.User_9):
           log(f"Using User.9 center: ({self.mm(center_x)}, {self.mm(center_y)}) mm")
       else:
-          bbox = board.GetBoundingBox()
-          center_x = bbox.GetCenter().x
-          center_y = bbox.GetCenter().y
           log(f"Using board bbox center: ({self.mm(center_x)}, {self.mm(center_y)}) mm")
       
       # Collect all Edge.Cuts elements
       shapes = []
       line_segments = []
+      mm = self.mm
       
-      for drawing in board.GetDrawings():
-          if drawing.GetLayer() == pcbnew.Edge_Cuts and isinstance(drawing, pcbnew.PCB_SHAPE):
-              shape_type = drawing.GetShape()
+      for edge_cut in self.get_edge_cuts(board):
+          shape_type = edge_cut['type']
+          
+          if shape_type == SHAPE_SEGMENT:
+              # Collect line segments to form polygon
+              x1, y1 = mm(edge_cut['sx'] - center_x), mm(edge_cut['sy'] - center_y)
+              x2, y2 = mm(edge_cut['ex'] - center_x), mm(edge_cut['ey'] - center_y)
+              line_segments.append([(x1, y1), (x2, y2)])
+              log.debug("Line segment: (%s, %s) to (%s, %s)", x1, y1, x2, y2)
               
-              if shape_type == pcbnew.SHAPE_T_SEGMENT:
-                  # Collect line segments to form polygon
-                  start = drawing.GetStart()
-                  end = drawing.GetEnd()
-                  x1, y1 = self.mm(start.x - center_x), self.mm(start.y - center_y)
-                  x2, y2 = self.mm(end.x - center_x), self.mm(end.y - center_y)
-                  line_segments.append([(x1, y1), (x2, y2)])
-                  log(f"Line segment: ({x1}, {y1}) to ({x2}, {y2})")
-                  
-              elif shape_type == pcbnew.SHAPE_T_CIRCLE:
-                  # Add circle as separate shape with clearance
-                  center_circle = drawing.GetCenter()
-                  radius = drawing.GetRadius()
-                  cx, cy = self.mm(center_circle.x - center_x), self.mm(center_circle.y - center_y)
-                  r = self.mm(radius) + pcbClearence
-                  shapes.append(f"translate([{cx}, {cy}]) circle(r={r})")
-                  log(f"Circle: center ({cx}, {cy}), radius {r} (with clearance)")
-                  
-              elif shape_type == pcbnew.SHAPE_T_RECT:
-                  # Add rectangle as separate shape with clearance
-                  start = drawing.GetStart()
-                  end = drawing.GetEnd()
-                  x1, y1 = self.mm(start.x - center_x), self.mm(start.y - center_y)
-                  x2, y2 = self.mm(end.x - center_x), self.mm(end.y - center_y)
-                  w, h = abs(x2 - x1) + 2 * pcbClearence, abs(y2 - y1) + 2 * pcbClearence
-                  cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                  shapes.append(f"translate([{cx}, {cy}]) square([{w}, {h}], center=true)")
-                  log(f"Rectangle: center ({cx}, {cy}), size {w}x{h} (with clearance)")
-                  
-              elif shape_type == pcbnew.SHAPE_T_ARC:
-                  # Convert arc to polygon approximation
-                  center_arc = drawing.GetCenter()
-                  start = drawing.GetStart()
-                  end = drawing.GetEnd()
-                  
-                  # Calculate arc parameters
-                  cx, cy = self.mm(center_arc.x - center_x), self.mm(center_arc.y - center_y)
-                  sx, sy = self.mm(start.x - center_x), self.mm(start.y - center_y)
-                  ex, ey = self.mm(end.x - center_x), self.mm(end.y - center_y)
-                  
-                  # Calculate radius and angles
-                  import math
-                  radius = math.sqrt((sx - cx)**2 + (sy - cy)**2)
-                  start_angle = math.atan2(sy - cy, sx - cx)
-                  end_angle = math.atan2(ey - cy, ex - cx)
+          elif shape_type == SHAPE_CIRCLE:
+              # Add circle as separate shape with clearance
+              cx, cy = mm(edge_cut['cx'] - center_x), mm(edge_cut['cy'] - center_y)
+              r = mm(edge_cut['r']) + pcbClearence
+              shapes.append(f"translate([{cx}, {cy}]) circle(r={r})")
+              log.debug("Circle: center (%s, %s), radius %s (with clearance)", cx, cy, r)
+              
+          elif shape_type == SHAPE_RECT:
+              # Add rectangle as separate shape with clearance
+              x1, y1 = mm(edge_cut['sx'] - center_x), mm(edge_cut['sy'] - center_y)
+              x2, y2 = mm(edge_cut['ex'] - center_x), mm(edge_cut['ey'] - center_y)
+              w, h = abs(x2 - x1) + 2 * pcbClearence, abs(y2 - y1) + 2 * pcbClearence
+              cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+              shapes.append(f"translate([{cx}, {cy}]) square([{w}, {h}], center=true)")
+              log.debug("Rectangle: center (%s, %s), size %sx%s (with clearance)", cx, cy, w, h)
+              
+          elif shape_type == SHAPE_ARC:
+              # Convert arc to polygon approximation
+              cx, cy = mm(edge_cut['cx'] - center_x), mm(edge_cut['cy'] - center_y)
+              sx, sy = mm(edge_cut['sx'] - center_x), mm(edge_cut['sy'] - center_y)
+              ex, ey = mm(edge_cut['ex'] - center_x), mm(edge_cut['ey'] - center_y)
+              
+              # Calculate radius and angles
+              radius = math.hypot(sx - cx, sy - cy)
+              start_angle = math.atan2(sy - cy, sx - cx)
+              end_angle = math.atan2(ey - cy, ex - cx)
+              
+              if end_angle < start_angle:
+                  end_angle += 2 * math.pi
                   
-                  # Generate arc points (approximate with line segments)
+              # Generate arc points (approximate with line segments), using as many segments
+              # as needed to keep each chord within arcTolerance of the arc
+              max_step = 2 * math.acos(1 - arcTolerance / max(radius, arcTolerance))
+              num_segments = max(4, math.ceil((end_angle - start_angle) / max_step))
+              
+              if np is not None:
+                  angles = np.linspace(start_angle, end_angle, num_segments + 1)
+                  arc_points = list(zip((cx + radius * np.cos(angles)).tolist(),
+                                        (cy + radius * np.sin(angles)).tolist()))
+              else:
                   arc_points = []
-                  num_segments = max(8, int(abs(end_angle - start_angle) * 180 / math.pi / 10))
-                  
-                  if end_angle < start_angle:
-                      end_angle += 2 * math.pi
-                      
                   for i in range(num_segments + 1):
                       angle = start_angle + (end_angle - start_angle) * i / num_segments
                       x = cx + radius * math.cos(angle)
                       y = cy + radius * math.sin(angle)
                       arc_points.append((x, y))
-                  
-                  # Add arc points to line segments
-                  for i in range(len(arc_points) - 1):
-                      line_segments.append([arc_points[i], arc_points[i + 1]])
-                  
-                  log(f"Arc: center ({cx}, {cy}), radius {radius}, {num_segments} segments")
-      
-      # Build the final SCAD code
-      scad = ""
+              
+              # Add arc points to line segments, each consecutive pair of points is one segment
+              line_segments.extend(zip(arc_points, arc_points[1:]))
+              
+              log.debug("Arc: center (%s, %s), radius %s, %s segments", cx, cy, radius, num_segments)
+
+      # Build the final SCAD code: the clearance polygon (if any) and the other shapes
+      polygon_parts = []
       
       # If we have line segments, try to form a closed polygon
       if line_segments:
           polygon_points = self.connect_line_segments(line_segments)
           if polygon_points:
-              points_str = ",".join([f"[{x},{y}]" for x, y in polygon_points])
+              # %g keeps 6 significant digits (1 um on a 100 mm board) and keeps the SCAD file small
+              points_str = ",".join("[%g,%g]" % point for point in polygon_points)
               # Apply clearance using offset() for closed polygons
-              scad += f"    offset(r={pcbClearence}) polygon(points=[{points_str}]);\n"
+              polygon_parts.append(f"offset(r={pcbClearence}) polygon(points=[{points_str}])")
               log(f"Created polygon with {len(polygon_points)} points and {pcbClearence}mm clearance")
           else:
               # If we can't form a closed polygon, create individual line shapes with clearance
@@ -519,371 +748,341 @@ class StencilGenerator(pcbnew.ActionPlugin):
               for segment in line_segments:
                   (x1, y1), (x2, y2) = segment
                   # Create a thin rectangle for each line segment with increased width for clearance
-                  length = ((x2-x1)**2 + (y2-y1)**2)**0.5
-                  if length > 0.001:  # Avoid zero-length segments
+                  length2 = (x2-x1)**2 + (y2-y1)**2
+                  if length2 > 0.000001:  # Avoid zero-length segments, shorter than 0.001mm
+                      length = math.sqrt(length2)
                       angle = math.atan2(y2-y1, x2-x1) * 180 / math.pi
                       cx, cy = (x1+x2)/2, (y1+y2)/2
                       line_width = 0.1 + 2 * pcbClearence
                       shapes.append(f"translate([{cx}, {cy}]) rotate([0, 0, {angle}]) square([{length}, {line_width}], center=true)")
       
-      # Add other shapes to union if we have any
-      if shapes:
-          if scad:  # We already have a polygon
-              scad = f"    union() {{\n        offset(r={pcbClearence}) polygon(points=[{points_str}]);\n"
-              for shape in shapes:
-                  scad += f"        {shape};\n"
-              scad += "    }\n"
-          else:  # Only shapes, no polygon
-              if len(shapes) == 1:
-                  scad = f"    {shapes[0]};\n"
-              else:
-                  scad = "    union() {\n"
-                  for shape in shapes:
-                      scad += f"        {shape};\n"
-                  scad += "    }\n"
+      # Union the polygon with the other shapes if there is more than one
+      all_shapes = polygon_parts + shapes
+      if len(all_shapes) == 1:
+          out.write(f"    {all_shapes[0]};\n")
+      elif all_shapes:
+          out.write("    union() {\n")
+          out.write("".join(f"        {shape};\n" for shape in all_shapes))
+          out.write("    }\n")
       
       # Fallback if no Edge.Cuts found
-      if not scad:
+      if not all_shapes:
           log("No Edge.Cuts shapes found, using board bounding box fallback with clearance")
           bbox = board.GetBoundingBox()
           w = self.mm(bbox.GetWidth()) + 2 * pcbClearence
           h = self.mm(bbox.GetHeight()) + 2 * pcbClearence
-          scad = f"    square([{w}, {h}], center=true);\n"
+          out.write(f"    square([{w}, {h}], center=true);\n")
           log(f"Fallback size: {w} x {h} mm (with clearance)")
       
       log("=== Edge.Cuts analysis complete ===")
 
-      return scad
 
-
-    def generate_pcb_outline(self, board):
-        log = getattr(self, 'log_function', lambda msg: print(f"DEBUG: {msg}"))
-        self.debug_all_layers(board)
+    def generate_pcb_outline(self, board, out):
+        log = self.get_logger()
+        if DEBUG:
+            self.debug_all_layers(board)
         pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
         if pcb_rect:
             log("Using User.9 rectangle for PCB outline")
-            scad = f"    square([{self.mm(pcb_rect[2])}, {self.mm(pcb_rect[3])}], center=true);\n"
-            return scad
+            out.write(f"    square([{self.mm(pcb_rect[2])}, {self.mm(pcb_rect[3])}], center=true);\n")
         else:
             log("No User.9 rectangle found, falling back to Edge.Cuts")
-            return self.generate_pcb_outline_from_edge_cuts(board)
+            self.generate_pcb_outline_from_edge_cuts(board, out)
 
 
-    def get_pad_bounds(self, pad_info):
-        """Get the bounding box of a pad considering its rotation"""
-        import math
-        
-        angle_rad = math.radians(pad_info['angle'])
-        half_w = pad_info['width'] / 2
-        half_h = pad_info['height'] / 2
-        
-        # Calculate rotated corner positions
-        corners = [
-            (-half_w, -half_h),
-            (half_w, -half_h),
-            (half_w, half_h),
-            (-half_w, half_h)
-        ]
+    def build_pad_grid(self, xs, ys, cell_size):
+        """Bucket pad indices into a uniform grid of cell_size sized cells, keyed by (cell_x, cell_y)"""
+        grid = defaultdict(list)
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            grid[(int(x // cell_size), int(y // cell_size))].append(i)
+        return grid
+
+    def find_pad_groups(self, xs, ys, widths, heights):
+        """Group pads that are close to each other and need uniform shrinking, returns lists of pad indices"""
+        if not xs:
+            return []
+
+        # Consider pads close if they're within their largest dimension plus 2x the minimum mask width,
+        # so no neighbour of any pad can be further away than search_radius
+        max_dims = [max(width, height) for width, height in zip(widths, heights)]
+
+        def close_pairs_dense():
+            # All pairwise distances at once, the upper triangle holds every pair exactly once
+            x = np.asarray(xs, dtype=np.float64)
+            y = np.asarray(ys, dtype=np.float64)
+            dims = np.asarray(max_dims, dtype=np.float64)
+            dx = x[None, :] - x[:, None]
+            dy = y[None, :] - y[:, None]
+            threshold = np.maximum(dims[None, :], dims[:, None]) + min_mask_width * 2
+            close = np.triu(dx*dx + dy*dy < threshold * threshold, 1)
+            first, second = np.nonzero(close)
+            return zip(first.tolist(), second.tolist())
+
+        def close_pairs_grid():
+            # Bucket pad centers into a uniform grid with search_radius sized cells,
+            # neighbours can then only be found in the surrounding 3x3 cells
+            search_radius = max(max(max_dims) + min_mask_width * 2, 0.001)
+            grid = self.build_pad_grid(xs, ys, search_radius)
+
+            def candidate_pairs():
+                # Every pair of neighbouring cells is visited once: the pads within a cell, then
+                # against the cells to the right and above (the other neighbours visit this cell)
+                for (cell_x, cell_y), members in grid.items():
+                    for a, i in enumerate(members):
+                        for j in members[a + 1:]:
+                            yield i, j
+                    for offset_x, offset_y in ((1, -1), (1, 0), (1, 1), (0, 1)):
+                        others = grid.get((cell_x + offset_x, cell_y + offset_y))
+                        if others:
+                            for i in members:
+                                for j in others:
+                                    yield i, j
+
+            for i, j in candidate_pairs():
+                dx = xs[j] - xs[i]
+                dy = ys[j] - ys[i]
+                threshold = max(max_dims[i], max_dims[j]) + min_mask_width * 2
+
+                if dx*dx + dy*dy < threshold * threshold:
+                    yield i, j
+
+        # Union-find (union by rank with path halving) over all pairs of close pads
+        parent = list(range(len(xs)))
+        rank = [0] * len(xs)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i == root_j:
+                return
+            if rank[root_i] < rank[root_j]:
+                root_i, root_j = root_j, root_i
+            parent[root_j] = root_i
+            if rank[root_i] == rank[root_j]:
+                rank[root_i] += 1
+
+        if np is not None and len(xs) <= DENSE_PAIRS_MAX_PADS:
+            close_pairs = close_pairs_dense()
+        else:
+            close_pairs = close_pairs_grid()
+        for i, j in close_pairs:
+            union(i, j)
+
+        groups = defaultdict(list)
+        for i in range(len(xs)):
+            groups[find(i)].append(i)
+
+        return list(groups.values())
+
+    def calculate_group_shrink_factor(self, group_indices, xs, ys, half_widths, half_heights):
+        """Calculate separate shrink factors for width and height for a group of closely packed pads.
         
-        rotated_corners = []
-        for x, y in corners:
-            rx = x * math.cos(angle_rad) - y * math.sin(angle_rad)
-            ry = x * math.sin(angle_rad) + y * math.cos(angle_rad)
-            rotated_corners.append((rx + pad_info['x'], ry + pad_info['y']))
+        xs, ys, half_widths and half_heights hold the geometry of all pads of the board (NumPy arrays
+        when NumPy is available, plain lists otherwise) and are indexed by group_indices.
+        """
+        if len(group_indices) <= 1:
+            return {'width': 1.0, 'height': 1.0}  # No shrinking needed for single pads
         
-        min_x = min(corner[0] for corner in rotated_corners)
-        max_x = max(corner[0] for corner in rotated_corners)
-        min_y = min(corner[1] for corner in rotated_corners)
-        max_y = max(corner[1] for corner in rotated_corners)
+        if np is None:
+            min_width_shrink, min_height_shrink = shrink_kernel(
+                group_indices, xs, ys, half_widths, half_heights, min_mask_width, min_pad_size)
+        else:
+            min_width_shrink = None
+            if len(group_indices) >= JIT_MIN_GROUP:
+                min_width_shrink, min_height_shrink = self.jit_group_shrink(
+                    group_indices, xs, ys, half_widths, half_heights)
+            if min_width_shrink is None:
+                min_width_shrink, min_height_shrink = self.vectorized_group_shrink(
+                    group_indices, xs, ys, half_widths, half_heights)
         
         return {
-            'min_x': min_x,
-            'max_x': max_x,
-            'min_y': min_y,
-            'max_y': max_y,
-            'width': max_x - min_x,
-            'height': max_y - min_y
+            'width': max(min_pad_size, min_width_shrink),
+            'height': max(min_pad_size, min_height_shrink)
         }
 
-    def find_close_pads(self, current_pad, all_pads, current_index, search_radius):
-        """Find pads within search_radius of the current pad"""
-        import math
-        
-        close_pads = []
-        current_x = current_pad['x']
-        current_y = current_pad['y']
-        
-        for i, pad in enumerate(all_pads):
-            if i == current_index:
-                continue
-                
-            dx = pad['x'] - current_x
-            dy = pad['y'] - current_y
-            distance = math.sqrt(dx*dx + dy*dy)
-            
-            if distance <= search_radius:
-                close_pads.append(pad)
-        
-        return close_pads
-
+    def jit_group_shrink(self, group_indices, xs, ys, half_widths, half_heights):
+        """Return the (width, height) shrink factors of a pad group from the Numba compiled kernel,
+        or (None, None) when Numba is not available or the kernel fails to compile or load"""
+        global shrink_kernel_jit
+        kernel_jit = get_shrink_kernel_jit()
+        if kernel_jit is None:
+            return None, None
+        try:
+            # The first call compiles the kernel, or loads it from the on-disk cache
+            return kernel_jit(np.asarray(group_indices, dtype=np.int64), xs, ys, half_widths, half_heights,
+                              min_mask_width, min_pad_size)
+        except Exception as e:
+            self.get_logger()(f"Numba shrink kernel unavailable, using NumPy instead: {e!r}")
+            shrink_kernel_jit = False
+            return None, None
 
-    def project_pad_dimension(self, pad_info, direction_x, direction_y):
-        """Project pad's half-dimension onto a given direction"""
-        import math
+    def vectorized_group_shrink(self, group_indices, xs, ys, half_widths, half_heights):
+        """Return the (width, height) shrink factors of a pad group with NumPy, the same checks as
+        shrink_kernel but over all pad pairs at once (small groups still go through shrink_kernel)"""
+        group = np.asarray(group_indices)
+        n = len(group)
+        xs, ys, half_widths, half_heights = xs[group], ys[group], half_widths[group], half_heights[group]
         
-        angle_rad = math.radians(pad_info['angle'])
-        half_w = pad_info['width'] / 2
-        half_h = pad_info['height'] / 2
+        if n < VECTORIZE_MIN_GROUP:
+            return shrink_kernel(
+                range(n), xs.tolist(), ys.tolist(), half_widths.tolist(), half_heights.tolist(),
+                min_mask_width, min_pad_size)
         
-        # Pad's local axes in global coordinates
-        pad_x_axis = (math.cos(angle_rad), math.sin(angle_rad))
-        pad_y_axis = (-math.sin(angle_rad), math.cos(angle_rad))
+        # All pad pairs (i < j) of the group
+        iu, ju = np.triu_indices(n, 1)
+        dx = xs[ju] - xs[iu]
+        dy = ys[ju] - ys[iu]
+        abs_dx = np.abs(dx)
+        abs_dy = np.abs(dy)
         
-        # Project pad dimensions onto the given direction
-        proj_x = abs(half_w * (pad_x_axis[0] * direction_x + pad_x_axis[1] * direction_y))
-        proj_y = abs(half_h * (pad_y_axis[0] * direction_x + pad_y_axis[1] * direction_y))
+        # Classify pairs as primarily X-direction, primarily Y-direction or diagonal separation
+        separated = dx*dx + dy*dy >= 0.000001  # Skip (nearly) coincident pads, closer than 0.001mm
+        x_direction = separated & (abs_dx > abs_dy * 1.5)
+        y_direction = separated & ~x_direction & (abs_dy > abs_dx * 1.5)
+        diagonal = separated & ~x_direction & ~y_direction
         
-        return proj_x + proj_y
-
-    def find_pad_groups(self, all_pads):
-        """Group pads that are close to each other and need uniform shrinking"""
-        import math
+        # X-direction and diagonal pairs constrain the width, Y-direction and diagonal pairs the height
+        half_widths_1, half_widths_2 = half_widths[iu], half_widths[ju]
+        half_heights_1, half_heights_2 = half_heights[iu], half_heights[ju]
+        gap_x = abs_dx - half_widths_1 - half_widths_2
+        gap_y = abs_dy - half_heights_1 - half_heights_2
+        constrained_x = (x_direction | diagonal) & (gap_x < min_mask_width)
+        constrained_y = (y_direction | diagonal) & (gap_y < min_mask_width)
         
-        groups = []
-        processed = set()
+        # Required shrink of every pair, unconstrained pairs count as 1.0 (no shrinking)
+        required_shrink_x = (abs_dx - min_mask_width) / (half_widths_1 + half_widths_2)
+        required_shrink_y = (abs_dy - min_mask_width) / (half_heights_1 + half_heights_2)
+        min_width_shrink = float(np.where(constrained_x, required_shrink_x, 1.0).min())
+        min_height_shrink = float(np.where(constrained_y, required_shrink_y, 1.0).min())
         
-        for i, pad in enumerate(all_pads):
-            if i in processed:
-                continue
-                
-            # Start a new group with this pad
-            current_group = [i]
-            processed.add(i)
-            
-            # Find all pads connected to this group
-            changed = True
-            while changed:
-                changed = False
-                for j, other_pad in enumerate(all_pads):
-                    if j in processed:
-                        continue
-                        
-                    # Check if this pad is close to any pad in the current group
-                    for group_idx in current_group:
-                        group_pad = all_pads[group_idx]
-                        dx = other_pad['x'] - group_pad['x']
-                        dy = other_pad['y'] - group_pad['y']
-                        distance = math.sqrt(dx*dx + dy*dy)
-                        
-                        # Consider pads close if they're within 2x the minimum mask width
-                        max_dimension = max(group_pad['width'], group_pad['height'], 
-                                          other_pad['width'], other_pad['height'])
-                        threshold = max_dimension + min_mask_width * 2
-                        
-                        if distance < threshold:
-                            current_group.append(j)
-                            processed.add(j)
-                            changed = True
-                            break
-                    
-                    if changed:
-                        break
-            
-            groups.append(current_group)
+        # Ensure minimum pad size
+        widths = 2 * half_widths
+        heights = 2 * half_heights
+        min_width_shrink = max(min_width_shrink, float(np.where(
+            widths * min_width_shrink < min_pad_size, min_pad_size / widths, min_width_shrink).max()))
+        min_height_shrink = max(min_height_shrink, float(np.where(
+            heights * min_height_shrink < min_pad_size, min_pad_size / heights, min_height_shrink).max()))
         
-        return groups
+        return min_width_shrink, min_height_shrink
 
-    def calculate_group_shrink_factor(self, group_indices, all_pads):
-        """Calculate separate shrink factors for width and height for a group of closely packed pads"""
-        import math
-        
-        if len(group_indices) <= 1:
-            return {'width': 1.0, 'height': 1.0}  # No shrinking needed for single pads
-        
-        group_pads = [all_pads[i] for i in group_indices]
-        
-        # Find the most constraining pad pairs for each direction
-        min_width_shrink = 1.0
-        min_height_shrink = 1.0
-        
-        for i, pad1 in enumerate(group_pads):
-            for j, pad2 in enumerate(group_pads):
-                if i >= j:
+    def generate_pads(self, board, out):
+        # Nothing to scan when neither copper side is selected
+        if not (front_copper_pads or back_copper_pads):
+            out.write("    // No copper layers enabled for SMD pads\n")
+            return
+
+        # Center on User.9, falling back to the board bounding box center
+        center_x, center_y = self.get_board_center(board)
+
+        # Collect all SMD pads filtered by layer, with raw nm positions and sizes
+        xs_nm, ys_nm, widths_nm, heights_nm, angles = [], [], [], [], []
+        xs_nm_append, ys_nm_append = xs_nm.append, ys_nm.append
+        widths_nm_append, heights_nm_append, angles_append = widths_nm.append, heights_nm.append, angles.append
+        attrib_smd = pcbnew.PAD_ATTRIB_SMD
+        f_cu = pcbnew.F_Cu
+        b_cu = pcbnew.B_Cu
+        want_front = front_copper_pads
+        want_back = back_copper_pads
+        for module in board.GetFootprints():
+            for pad in module.Pads():
+                if pad.GetAttribute() != attrib_smd:
                     continue
-                    
-                dx = pad2['x'] - pad1['x']
-                dy = pad2['y'] - pad1['y']
-                distance = math.sqrt(dx*dx + dy*dy)
                 
-                if distance < 0.001:
+                # Only add pad if it is on a copper layer selected in the global configuration,
+                # a layer is only checked when selected and B.Cu not once F.Cu already matched
+                pad_layers = pad.GetLayerSet()
+                if not ((want_front and pad_layers.Contains(f_cu)) or
+                        (want_back and pad_layers.Contains(b_cu))):
                     continue
                 
-                # Check X-direction constraint (pads side-by-side)
-                if abs(dx) > abs(dy) * 1.5:  # Primarily X-direction separation
-                    pad1_half_width = pad1['width'] / 2
-                    pad2_half_width = pad2['width'] / 2
-                    current_gap = abs(dx) - pad1_half_width - pad2_half_width
-                    
-                    if current_gap < min_mask_width:
-                        required_shrink = (abs(dx) - min_mask_width) / (pad1_half_width + pad2_half_width)
-                        min_width_shrink = min(min_width_shrink, required_shrink)
-                
-                # Check Y-direction constraint (pads above/below each other)
-                elif abs(dy) > abs(dx) * 1.5:  # Primarily Y-direction separation
-                    pad1_half_height = pad1['height'] / 2
-                    pad2_half_height = pad2['height'] / 2
-                    current_gap = abs(dy) - pad1_half_height - pad2_half_height
-                    
-                    if current_gap < min_mask_width:
-                        required_shrink = (abs(dy) - min_mask_width) / (pad1_half_height + pad2_half_height)
-                        min_height_shrink = min(min_height_shrink, required_shrink)
-                
-                # Check diagonal constraints (pads close in both directions)
-                else:
-                    # Both X and Y constraints may apply
-                    pad1_half_width = pad1['width'] / 2
-                    pad2_half_width = pad2['width'] / 2
-                    pad1_half_height = pad1['height'] / 2
-                    pad2_half_height = pad2['height'] / 2
-                    
-                    current_gap_x = abs(dx) - pad1_half_width - pad2_half_width
-                    current_gap_y = abs(dy) - pad1_half_height - pad2_half_height
-                    
-                    if current_gap_x < min_mask_width:
-                        required_shrink_x = (abs(dx) - min_mask_width) / (pad1_half_width + pad2_half_width)
-                        min_width_shrink = min(min_width_shrink, required_shrink_x)
-                    
-                    if current_gap_y < min_mask_width:
-                        required_shrink_y = (abs(dy) - min_mask_width) / (pad1_half_height + pad2_half_height)
-                        min_height_shrink = min(min_height_shrink, required_shrink_y)
-        
-        # Ensure minimum pad size (don't shrink below 0.1mm)
-        for pad in group_pads:
-            if pad['width'] * min_width_shrink < min_pad_size:
-                min_width_shrink = max(min_width_shrink, min_pad_size / pad['width'])
-            if pad['height'] * min_height_shrink < min_pad_size:
-                min_height_shrink = max(min_height_shrink, min_pad_size / pad['height'])
-        
-        return {
-            'width': max(min_pad_size, min_width_shrink),
-            'height': max(min_pad_size, min_height_shrink)
-        }
+                pos = pad.GetPosition()
+                size = pad.GetSize()
+                xs_nm_append(pos.x)
+                ys_nm_append(pos.y)
+                widths_nm_append(size.x)
+                heights_nm_append(size.y)
+                angles_append(pad.GetOrientation().AsDegrees())
 
+        if not xs_nm:
+            out.write("    // No SMD pads found matching layer criteria\n")
+            return
 
-    def generate_pads(self, board):
-        scad = ""
-        
-        # Try to get center from User.9 first
-        pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
-        if pcb_rect:
-            center_x = pcb_rect[0] + pcb_rect[2]/2
-            center_y = pcb_rect[1] + pcb_rect[3]/2
+        # Convert all positions (relative to the center) and sizes to mm in one go, pads are
+        # stored as one list per field, and for the shrink factors as pad geometry arrays
+        # (with the pad half sizes the pairwise gaps are measured with)
+        if np is not None:
+            pad_array = np.array([xs_nm, ys_nm, widths_nm, heights_nm], dtype=np.float64)
+            pad_array -= np.array([[center_x], [center_y], [0], [0]], dtype=np.float64)
+            pad_array /= 1e6
+            xs, ys, widths, heights = pad_array.tolist()
+            geometry = (pad_array[0], pad_array[1], pad_array[2] * 0.5, pad_array[3] * 0.5)
         else:
-            # Fallback to board bounding box center
-            bbox = board.GetBoundingBox()
-            center_x = bbox.GetCenter().x
-            center_y = bbox.GetCenter().y
-
-        # Collect all SMD pads with their information, filtered by layer
-        pads_info = []
-        for module in board.GetFootprints():
-            for pad in module.Pads():
-                if pad.GetAttribute() == pcbnew.PAD_ATTRIB_SMD:
-                    # Check which copper layer(s) the pad is on
-                    pad_layers = pad.GetLayerSet()
-                    is_front_copper = pad_layers.Contains(pcbnew.F_Cu)
-                    is_back_copper = pad_layers.Contains(pcbnew.B_Cu)
-                    
-                    # Filter based on global configuration variables
-                    should_include = False
-                    if front_copper_pads and is_front_copper:
-                        should_include = True
-                    if back_copper_pads and is_back_copper:
-                        should_include = True
-                    
-                    # Only add pad if it matches the layer criteria
-                    if should_include:
-                        pos = pad.GetPosition()
-                        size = pad.GetSize()
-                        angle = pad.GetOrientation().AsDegrees()
-                        pads_info.append({
-                            'x': self.mm(pos.x - center_x),
-                            'y': self.mm(pos.y - center_y),
-                            'width': self.mm(size.x),
-                            'height': self.mm(size.y),
-                            'angle': angle,
-                            'pad': pad
-                        })
-
-        if not pads_info:
-            return "    // No SMD pads found matching layer criteria\n"
+            xs = self.mm_list(xs_nm, center_x)
+            ys = self.mm_list(ys_nm, center_y)
+            widths = self.mm_list(widths_nm)
+            heights = self.mm_list(heights_nm)
+            geometry = (xs, ys, [width * 0.5 for width in widths], [height * 0.5 for height in heights])
 
         # Group pads that are close to each other
-        pad_groups = self.find_pad_groups(pads_info)
+        pad_groups = self.find_pad_groups(xs, ys, widths, heights)
         
-        # Calculate shrink factors for each group
-        group_shrink_factors = {}
+        # Calculate shrink factors for each group, stored as one width and height factor per pad
+        width_factors = [1.0] * len(xs)
+        height_factors = [1.0] * len(xs)
         for group_indices in pad_groups:
-            shrink_factors = self.calculate_group_shrink_factor(group_indices, pads_info)
+            shrink_factors = self.calculate_group_shrink_factor(group_indices, *geometry)
             for idx in group_indices:
-                group_shrink_factors[idx] = shrink_factors
+                width_factors[idx] = shrink_factors['width']
+                height_factors[idx] = shrink_factors['height']
 
-        # Generate pad cutouts with directional shrinking per group
-        for i, pad_info in enumerate(pads_info):
-            shrink_factors = group_shrink_factors.get(i, {'width': 1.0, 'height': 1.0})
-            
-            adjusted_width = pad_info['width'] * shrink_factors['width']
-            adjusted_height = pad_info['height'] * shrink_factors['height']
-            
-            scad += f"    translate([{pad_info['x']}, {pad_info['y']}]) "
-            scad += f"rotate([0, 0, {pad_info['angle']}]) "
-            scad += f"square([{adjusted_width}, {adjusted_height}], center=true);\n"
-        
-        return scad
+        # Generate pad cutouts with directional shrinking per group, written in one go
+        pad_row = "    translate([%s, %s]) rotate([0, 0, %s]) square([%s, %s], center=true);\n"
+        out.write("".join(pad_row % (x, y, angle, width * width_factor, height * height_factor)
+                          for x, y, angle, width, height, width_factor, height_factor
+                          in zip(xs, ys, angles, widths, heights, width_factors, height_factors)))
 
-    def generate_alignment_holes(self, board):
+    def generate_alignment_holes(self, board, out):
         alignment_holes = self.find_circles_on_layer(board, pcbnew.User_7)
         if not alignment_holes:
-            return "    // No alignment holes found on User.7 layer\n"
+            out.write("    // No alignment holes found on User.7 layer\n")
+            return
 
-        pcb_rect = self.find_shape_on_layer(board, pcbnew.User_9)
-        if not pcb_rect:
-            return "    // No PCB outline found on User.9 layer\n"
+        if not self.find_shape_on_layer(board, pcbnew.User_9):
+            out.write("    // No PCB outline found on User.9 layer\n")
+            return
 
-        center_x = pcb_rect[0] + pcb_rect[2]/2
-        center_y = pcb_rect[1] + pcb_rect[3]/2
+        center_x, center_y = self.get_board_center(board)
 
-        scad = ""
-        for hole in alignment_holes:
-            x = self.mm(hole[0] - center_x)
-            y = self.mm(hole[1] - center_y)
-            scad += f"    translate([{x}, {y}, -0.005]) "
-            scad += f"cylinder(h=frame_height + 0.01, d=alignment_pin_diameter, center=false);\n"
-        return scad
+        xs = self.mm_list([hole[0] for hole in alignment_holes], center_x)
+        ys = self.mm_list([hole[1] for hole in alignment_holes], center_y)
+        hole_row = "    translate([%s, %s, -0.005]) cylinder(h=frame_height + 0.01, d=alignment_pin_diameter, center=false);\n"
+        out.write("".join(hole_row % position for position in zip(xs, ys)))
 
     def find_shape_on_layer(self, board, layer):
-        for drawing in board.GetDrawings():
-            if (isinstance(drawing, pcbnew.PCB_SHAPE) and
-                drawing.GetShape() == pcbnew.SHAPE_T_RECT and
-                    drawing.GetLayer() == layer):
-                return (drawing.GetStart().x, drawing.GetStart().y,
-                        drawing.GetEnd().x - drawing.GetStart().x,
-                        drawing.GetEnd().y - drawing.GetStart().y)
+        if layer not in self._shape_cache:
+            self._shape_cache[layer] = self.scan_shape_on_layer(board, layer)
+        return self._shape_cache[layer]
+
+    def scan_shape_on_layer(self, board, layer):
+        for drawing in self.get_shapes_on_layer(board, layer, SHAPE_RECT):
+            start = drawing.GetStart()
+            end = drawing.GetEnd()
+            return (start.x, start.y, end.x - start.x, end.y - start.y)
         return None
 
     def find_circles_on_layer(self, board, layer):
         circles = []
-        for drawing in board.GetDrawings():
-            if (isinstance(drawing, pcbnew.PCB_SHAPE) and
-                drawing.GetShape() == pcbnew.SHAPE_T_CIRCLE and
-                    drawing.GetLayer() == layer):
-                center = drawing.GetCenter()
-                circles.append((center.x, center.y))
+        circles_append = circles.append
+        for drawing in self.get_shapes_on_layer(board, layer, SHAPE_CIRCLE):
+            center = drawing.GetCenter()
+            circles_append((center.x, center.y))
         return circles
 
-    def mm(self, nm):
-        return nm / 1e6
-
     def debug_all_layers(self, board):
         """Debug function to list all layers with drawings"""
         try:
@@ -895,18 +1094,14 @@ class StencilGenerator(pcbnew.ActionPlugin):
             with open(log_file, "w", encoding="utf-8") as f:
                 f.write(f"=== All Layers Analysis ===\n")
                 
-                layer_counts = {}
-                for drawing in board.GetDrawings():
-                    layer = drawing.GetLayer()
-                    if layer not in layer_counts:
-                        layer_counts[layer] = 0
-                    layer_counts[layer] += 1
+                layer_counts = {layer: len(drawings)
+                                for layer, drawings in self.get_drawings_by_layer(board).items()}
                 
                 f.write(f"Total drawings: {sum(layer_counts.values())}\n")
                 for layer, count in sorted(layer_counts.items()):
                     f.write(f"Layer {layer}: {count} drawings\n")
                     
-                f.write(f"\nEdge_Cuts constant value: {pcbnew.Edge_Cuts}\n")
+                f.write(f"\nEdge_Cuts constant value: {EDGE_CUTS}\n")
         except Exception as e:
             print(f"Debug error: {e}")
 